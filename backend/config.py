@@ -1,4 +1,4 @@
-from pydantic import BaseSettings
+from pydantic_settings import BaseSettings, SettingsConfigDict
 from typing import List
 import os
 
@@ -16,10 +16,16 @@ class Settings(BaseSettings):
     upload_dir: str = "uploads"
     output_dir: str = "outputs"
     temp_dir: str = "temp"
+    tts_cache_dir: str = "tts_cache"
     
     # API settings
     api_host: str = "0.0.0.0"
     api_port: int = 8000
+    workers: int = 1
+    reload: bool = False  # Development only; cannot be combined with workers > 1
+    # Threads per worker for blocking work. Database access is async and does not
+    # use these threads, so this does not need to fit within the DB pool size.
+    threadpool_size: int = 100
     cors_origins: List[str] = ["*"]
     
     # Rate limiting
@@ -30,6 +36,7 @@ class Settings(BaseSettings):
     # TTS settings
     default_voice: str = "en-US-AndrewNeural"
     voices_cache_ttl: int = 3600  # 1 hour in seconds
+    tts_concurrency: int = 8  # Max simultaneous Edge TTS calls per batch
     
     # Logging
     log_level: str = "INFO"
@@ -38,9 +45,7 @@ class Settings(BaseSettings):
     # Cleanup settings
     cleanup_interval_hours: int = 24
     
-    class Config:
-        env_file = ".env"
-        env_file_encoding = "utf-8"
+    model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
 # Global settings instance
 settings = Settings() 
\ No newline at end of file
@@ -1,15 +1,33 @@
-from sqlalchemy import create_engine, Column, String, DateTime, Integer, Float, Boolean
+from sqlalchemy import Column, String, DateTime, Integer, Float, Boolean, event, inspect, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
 from datetime import datetime
 import uuid
 
-# Create the database engine (SQLite for simplicity)
-DATABASE_URL = "sqlite:///./tts_database.db"
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Create the async database engine (SQLite for simplicity)
+DATABASE_URL = "sqlite+aiosqlite:///./tts_database.db"
+POOL_SIZE = 20
+engine = create_async_engine(
+    DATABASE_URL,
+    pool_size=POOL_SIZE,
+    max_overflow=10,
+    pool_pre_ping=True,
+)
 
-# Create a SessionLocal class
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Tune SQLite on every new connection: WAL lets readers run alongside writers
+@event.listens_for(engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-64000")  # 64MB page cache
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")  # 256MB
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+# Create an async session factory
+AsyncSessionMaker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 # Create a Base class
 Base = declarative_base()
@@ -24,6 +42,8 @@ class FileUpload(Base):
     file_size = Column(Integer, nullable=False)
     encoding = Column(String)
     encoding_confidence = Column(Float)
+    stored_path = Column(String)  # Uploaded file as received
+    utf8_path = Column(String)  # UTF-8 copy used for TTS
     is_deleted = Column(Boolean, default=False)
 
 class TTSGeneration(Base):
@@ -57,13 +77,32 @@ class BatchProcess(Base):
     is_completed = Column(Boolean, default=False)
 
 # Dependency to get database session
-def get_db():
-    db = SessionLocal()
-    try:
+async def get_db():
+    async with AsyncSessionMaker() as db:
         yield db
-    finally:
-        db.close()
+
+# create_all never alters existing tables, so add columns introduced after a table was created
+def add_missing_columns(conn):
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing:
+                column_type = column.type.compile(dialect=conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
 
 # Create all tables
-def create_tables():
-    Base.metadata.create_all(bind=engine) 
\ No newline at end of file
+async def create_tables():
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(add_missing_columns)
+
+# Open the pool's connections up front so the first requests don't pay for them
+async def warm_pool():
+    connections = [await engine.connect() for _ in range(POOL_SIZE)]
+    try:
+        for conn in connections:
+            await conn.execute(text("SELECT 1"))
+    finally:
+        for conn in connections:
+            await conn.close()
@@ -1,37 +1,49 @@
 import os
-import chardet
-import nltk
+import sys
+import hashlib
+import re
+import codecs
 import tempfile
 import asyncio
-import aiofiles
 import uuid
 import zipfile
-import io
 import logging
 import traceback
+import time
 from datetime import datetime, timedelta
-from functools import lru_cache
 from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Dict, List, Optional, Tuple
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Depends, Request
-from fastapi.responses import FileResponse, StreamingResponse
+from anyio import to_thread
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, Request
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.openapi.utils import get_openapi
-from sqlalchemy.orm import Session
+from sqlalchemy import insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
+import aiohttp
 import edge_tts
+from zipstream import ZipStream
 import shutil
 from pathlib import Path
-import json
+import orjson
+
+# Prefer the C-backed detector; fall back to pure-Python chardet
+try:
+    import cchardet as chardet
+except ImportError:
+    import chardet
 
 # Import our modules
 from config import settings
 from auth import verify_credentials, optional_auth
-from database import get_db, create_tables, FileUpload, TTSGeneration, BatchProcess
+from database import get_db, create_tables, warm_pool, AsyncSessionMaker, FileUpload, TTSGeneration, BatchProcess
 from models import (
     TTSRequest, BatchProcessRequest, VoiceInfo, ProcessedFilesInfo,
     UploadResponse, TTSResponse, BatchProcessResponse, ErrorResponse,
@@ -45,50 +57,98 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Download NLTK data if it doesn't exist
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    logger.info("Downloading NLTK punkt tokenizer...")
-    nltk.download('punkt')
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Only this many leading bytes are fed to the encoding detector
+DETECT_SAMPLE_SIZE = 64 * 1024
+# Removed files are marked deleted in the database this many at a time
+CLEANUP_BATCH_SIZE = 500
 
 # Rate limiter setup
 limiter = Limiter(key_func=get_remote_address)
 
+class SharedConnector(aiohttp.TCPConnector):
+    """TCP connector shared by every Edge TTS call
+    
+    edge_tts opens a short-lived ClientSession per call, and that session closes its
+    connector on exit; ignore that so the DNS cache and idle HTTPS connections outlive it.
+    """
+    
+    def close(self, *, abort_ssl: bool = False) -> Awaitable[None]:
+        # Keep BaseConnector's contract: a plain call returning an awaitable
+        done = asyncio.get_running_loop().create_future()
+        done.set_result(None)
+        return done
+    
+    async def shutdown(self):
+        await super().close()
+
+# Created in the lifespan; None (edge_tts' own per-call connector) until then
+_tts_connector: Optional[SharedConnector] = None
+
 # Lifespan context manager for startup/shutdown events
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    global _tts_connector
+    
     # Startup
     logger.info("Starting SimpleTTS API...")
     
-    # Create database tables
-    create_tables()
-    logger.info("Database tables created/verified")
-    
-    # Create directories if they don't exist
-    for directory in [settings.upload_dir, settings.output_dir, settings.temp_dir]:
-        Path(directory).mkdir(exist_ok=True)
-    logger.info("Directories created/verified")
-    
-    # Start background cleanup task
-    cleanup_task = asyncio.create_task(periodic_cleanup())
-    logger.info("Background cleanup task started")
-    
-    yield
-    
-    # Shutdown
-    logger.info("Shutting down SimpleTTS API...")
-    cleanup_task.cancel()
+    # Share one connector across Edge TTS calls
+    _tts_connector = SharedConnector(limit=32, ttl_dns_cache=300)
     try:
-        await cleanup_task
-    except asyncio.CancelledError:
-        logger.info("Cleanup task cancelled")
+        # Size both thread pools: anyio's runs sync dependencies, asyncio's runs our to_thread file work
+        to_thread.current_default_thread_limiter().total_tokens = settings.threadpool_size
+        asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=settings.threadpool_size))
+        
+        # Create database tables
+        await create_tables()
+        logger.info("Database tables created/verified")
+        
+        await warm_pool()
+        logger.info("Database connection pool warmed")
+        
+        # Create directories if they don't exist
+        for directory in [settings.upload_dir, settings.output_dir, settings.temp_dir, settings.tts_cache_dir]:
+            Path(directory).mkdir(exist_ok=True)
+        logger.info("Directories created/verified")
+        
+        # Uploads from before paths were stored get theirs filled in once, here
+        await backfill_upload_paths()
+        
+        # Load the voice list so requests can be checked against it
+        try:
+            await get_cached_voices()
+        except HTTPException:
+            logger.warning("Voice list unavailable at startup; voice names will not be checked")
+        
+        # Build the OpenAPI schema now so the first /docs visitor doesn't pay for it
+        app.openapi()
+        
+        # Start background cleanup task
+        cleanup_task = asyncio.create_task(periodic_cleanup())
+        logger.info("Background cleanup task started")
+        
+        yield
+        
+        # Shutdown
+        logger.info("Shutting down SimpleTTS API...")
+        cleanup_task.cancel()
+        try:
+            await cleanup_task
+        except asyncio.CancelledError:
+            logger.info("Cleanup task cancelled")
+    finally:
+        # Close the connector even when startup fails part-way
+        await _tts_connector.shutdown()
+        _tts_connector = None
 
 app = FastAPI(
     title="SimpleTTS API",
     version="1.0.0",
     description="Text-to-Speech API using Microsoft Edge TTS with authentication and rate limiting",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Setup rate limiter
@@ -105,14 +165,13 @@ app.add_middleware(
 )
 
 # Serve static files
-app.mount("/outputs", StaticFiles(directory=settings.output_dir), name="outputs")
+app.mount("/outputs", StaticFiles(directory=settings.output_dir, check_dir=False), name="outputs")
 
 # Custom exception handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
     logger.error(f"HTTP {exc.status_code} error on {request.url}: {exc.detail}")
-    from fastapi.responses import JSONResponse
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={
             "detail": exc.detail,
@@ -124,8 +183,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 @app.exception_handler(Exception)
 async def general_exception_handler(request: Request, exc: Exception):
     logger.error(f"Unexpected error on {request.url}: {str(exc)}\n{traceback.format_exc()}")
-    from fastapi.responses import JSONResponse
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={
             "detail": "Internal server error",
@@ -134,34 +192,52 @@ async def general_exception_handler(request: Request, exc: Exception):
         }
     )
 
-# Cache for voices
-@lru_cache(maxsize=1)
+# Cache for voices: (fetched_at, voices), refreshed every voices_cache_ttl seconds
+_voices_cache: Optional[Tuple[float, list]] = None
+_voices_lock = asyncio.Lock()
+
+# Serialized /voices payload, paired with the voice list it was built from
+_voices_response: Optional[Tuple[list, bytes]] = None
+
+# Names from the last successful voices fetch; None until one has succeeded
+_valid_voices: Optional[frozenset] = None
+
 async def get_cached_voices():
     """Get and cache the list of available voices"""
-    try:
-        logger.info("Fetching voices from Edge TTS...")
-        voices = await edge_tts.list_voices()
-        logger.info(f"Retrieved {len(voices)} voices")
+    global _voices_cache, _valid_voices
+    
+    if _voices_cache and time.monotonic() - _voices_cache[0] < settings.voices_cache_ttl:
+        return _voices_cache[1]
+    
+    # Only one request refetches; the others wait and reuse its result
+    async with _voices_lock:
+        if _voices_cache and time.monotonic() - _voices_cache[0] < settings.voices_cache_ttl:
+            return _voices_cache[1]
+        
+        try:
+            logger.info("Fetching voices from Edge TTS...")
+            voices = await edge_tts.list_voices(connector=_tts_connector)
+            logger.info(f"Retrieved {len(voices)} voices")
+        except Exception as e:
+            logger.error(f"Failed to fetch voices: {str(e)}")
+            raise HTTPException(status_code=500, detail="Failed to fetch voices from TTS service")
+        
+        _voices_cache = (time.monotonic(), voices)
+        # Edge TTS accepts both the short and the full voice name
+        _valid_voices = frozenset(
+            name for voice in voices for name in (voice["ShortName"], voice["Name"])
+        )
         return voices
-    except Exception as e:
-        logger.error(f"Failed to fetch voices: {str(e)}")
-        raise HTTPException(status_code=500, detail="Failed to fetch voices from TTS service")
 
 # Utility functions
-async def validate_file_size(file: UploadFile) -> None:
-    """Validate uploaded file size"""
-    max_size = settings.max_file_size_mb * 1024 * 1024
+def validate_voice(voice: str) -> None:
+    """Reject voices that Edge TTS does not offer
     
-    # Read the file content to check size
-    content = await file.read()
-    if len(content) > max_size:
-        raise HTTPException(
-            status_code=413, 
-            detail=f"File size exceeds maximum allowed size of {settings.max_file_size_mb}MB"
-        )
-    
-    # Reset file pointer
-    await file.seek(0)
+    Skipped until the voice list has been fetched at least once, so TTS keeps
+    working when the startup fetch fails.
+    """
+    if _valid_voices is not None and voice not in _valid_voices:
+        raise HTTPException(status_code=400, detail=f"Unknown voice: {voice}")
 
 async def validate_file_type(file: UploadFile) -> None:
     """Validate uploaded file type"""
@@ -176,16 +252,164 @@ async def validate_file_type(file: UploadFile) -> None:
                     detail=f"File type {file.content_type} not allowed. Supported types: {allowed_types}"
                 )
 
+def _tts_cache_path(text: str, voice: str, rate: str, volume: str, pitch: str) -> Path:
+    """Content-addressed cache location for a synthesis request"""
+    key = hashlib.blake2b(f"{voice}|{rate}|{volume}|{pitch}|{text}".encode("utf-8"), digest_size=16).hexdigest()
+    return Path(settings.tts_cache_dir) / f"{key}.mp3"
+
+def _reuse_cached_tts(cache_path: Path, output_path: Path) -> bool:
+    """Copy a cached result to output_path, returning False on a miss
+    
+    Outputs get their own copy rather than a hard link, so refreshing the cache
+    entry's mtime does not keep old outputs from expiring.
+    """
+    try:
+        shutil.copyfile(cache_path, output_path)
+    except FileNotFoundError:
+        return False
+    # Keep frequently requested entries from being swept as old
+    try:
+        os.utime(cache_path)
+    except FileNotFoundError:
+        pass
+    return True
+
+def _store_cached_tts(output_path: Path, cache_path: Path) -> None:
+    """Copy a fresh result into the cache, replacing atomically so readers never see a partial file"""
+    tmp_path = cache_path.with_name(f"{cache_path.stem}.{uuid.uuid4().hex}.tmp")
+    try:
+        shutil.copyfile(output_path, tmp_path)
+        os.replace(tmp_path, cache_path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
 async def process_text_to_speech(text: str, output_file: str, voice: str, rate: str, volume: str, pitch: str):
-    """Process text to speech using Edge TTS"""
+    """Process text to speech using Edge TTS, reusing earlier output for identical requests"""
+    cache_path = _tts_cache_path(text, voice, rate, volume, pitch)
+    if await asyncio.to_thread(_reuse_cached_tts, cache_path, Path(output_file)):
+        logger.info(f"TTS cache hit: {output_file}")
+        return
+    
     try:
         logger.info(f"Processing TTS: voice={voice}, text_length={len(text)}")
-        communicate = edge_tts.Communicate(text, voice, rate=rate, volume=volume, pitch=pitch)
+        communicate = edge_tts.Communicate(
+            text, voice, rate=rate, volume=volume, pitch=pitch, connector=_tts_connector
+        )
         await communicate.save(output_file)
         logger.info(f"TTS processing completed: {output_file}")
     except Exception as e:
         logger.error(f"TTS processing failed: {str(e)}")
         raise
+    
+    try:
+        await asyncio.to_thread(_store_cached_tts, Path(output_file), cache_path)
+    except OSError as e:
+        logger.warning(f"Failed to cache TTS output: {str(e)}")
+
+def _scan_legacy_uploads(file_ids: set) -> Dict[str, Tuple[Optional[str], Optional[str]]]:
+    """Map file IDs to their (stored, UTF-8) paths with one pass over the upload directory
+    
+    Uploads were once named {file_id}_{name} with a {file_id}_utf8_{name} copy; UUIDs
+    contain no underscore, so the ID is everything before the first one.
+    """
+    found = {}
+    with os.scandir(settings.upload_dir) as entries:
+        for entry in entries:
+            file_id, _, rest = entry.name.partition("_")
+            if file_id not in file_ids or not entry.is_file(follow_symlinks=False):
+                continue
+            stored_path, utf8_path = found.get(file_id, (None, None))
+            if rest.startswith("utf8_"):
+                utf8_path = str(Path(entry.path))
+            else:
+                stored_path = str(Path(entry.path))
+            found[file_id] = (stored_path, utf8_path)
+    return found
+
+async def backfill_upload_paths() -> None:
+    """Record paths for uploads stored before they were tracked in the database
+    
+    Rows whose files are already gone are marked deleted.
+    """
+    async with AsyncSessionMaker() as db:
+        legacy = (await db.scalars(
+            select(FileUpload).where(
+                FileUpload.stored_path.is_(None),
+                FileUpload.utf8_path.is_(None),
+                FileUpload.is_deleted.is_not(True)
+            )
+        )).all()
+        if not legacy:
+            return
+        
+        found = await asyncio.to_thread(_scan_legacy_uploads, {db_file.id for db_file in legacy})
+        for db_file in legacy:
+            if db_file.id in found:
+                db_file.stored_path, db_file.utf8_path = found[db_file.id]
+            else:
+                db_file.is_deleted = True
+        await db.commit()
+        logger.info(f"Backfilled paths for {len(found)} of {len(legacy)} legacy uploads")
+
+def _read_text_bounded(file_path: Path, encoding: str, max_size: int) -> str:
+    """Read a text file in one go, failing if it exceeds max_size characters"""
+    with open(file_path, 'r', encoding=encoding) as f:
+        content = f.read(max_size + 1)
+    if len(content) > max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"File content exceeds maximum text length of {max_size} characters"
+        )
+    return content
+
+def _save_upload(src, dst: Path, max_size: int) -> Tuple[int, dict]:
+    """Copy an upload to disk in chunks, detecting its encoding along the way
+    
+    ASCII and valid UTF-8 are recognised with C-level checks; the statistical
+    detector only runs once a chunk fails to decode as UTF-8.
+    Stops as soon as the size exceeds max_size; the caller must check the returned size.
+    """
+    detector = chardet.UniversalDetector()
+    utf8_check = codecs.getincrementaldecoder('utf-8')()
+    is_ascii = is_utf8 = True
+    has_bom = False
+    file_size = 0
+    sampled = 0
+    with open(dst, 'wb') as out_file:
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            if not file_size:
+                has_bom = chunk.startswith(codecs.BOM_UTF8)
+            file_size += len(chunk)
+            if file_size > max_size:
+                break
+            chunk_is_ascii = chunk.isascii()
+            is_ascii = is_ascii and chunk_is_ascii
+            # A pending partial character must still be completed by the next chunk
+            if is_utf8 and (not chunk_is_ascii or utf8_check.getstate()[0]):
+                try:
+                    utf8_check.decode(chunk)
+                except UnicodeDecodeError:
+                    is_utf8 = False
+            # Past the sample, only chunks with non-ASCII bytes can change the verdict
+            if not is_utf8 and not detector.done and (sampled < DETECT_SAMPLE_SIZE or not chunk_is_ascii):
+                detector.feed(chunk)
+                sampled += len(chunk)
+            out_file.write(chunk)
+    
+    if is_ascii:
+        return file_size, {'encoding': 'ascii', 'confidence': 1.0}
+    if is_utf8 and not utf8_check.getstate()[0]:
+        return file_size, {'encoding': 'utf-8-sig' if has_bom else 'utf-8', 'confidence': 1.0}
+    detector.close()
+    return file_size, detector.result
+
+def _convert_to_utf8(src: Path, dst: Path, encoding: str) -> None:
+    """Re-encode a file as UTF-8 chunk by chunk so the full text is never held in memory"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    with open(src, 'rb') as src_file, open(dst, 'w', encoding='utf-8') as utf8_file:
+        while chunk := src_file.read(UPLOAD_CHUNK_SIZE):
+            utf8_file.write(decoder.decode(chunk))
+        utf8_file.write(decoder.decode(b'', final=True))
 
 async def safe_file_read(file_path: Path, encoding: str = 'utf-8', max_size: int = None) -> str:
     """Safely read file content with size limits"""
@@ -193,20 +417,11 @@ async def safe_file_read(file_path: Path, encoding: str = 'utf-8', max_size: int
         max_size = settings.max_text_length
     
     try:
-        async with aiofiles.open(file_path, 'r', encoding=encoding) as f:
-            content = ""
-            chunk_size = 8192
-            while len(content) < max_size:
-                chunk = await f.read(chunk_size)
-                if not chunk:
-                    break
-                content += chunk
-                if len(content) > max_size:
-                    raise HTTPException(
-                        status_code=413,
-                        detail=f"File content exceeds maximum text length of {max_size} characters"
-                    )
-            return content
+        # One thread hop for the whole read instead of one per chunk
+        return await asyncio.to_thread(_read_text_bounded, file_path, encoding, max_size)
+    except FileNotFoundError:
+        logger.error(f"File missing on disk: {file_path}")
+        raise HTTPException(status_code=404, detail="File not found")
     except UnicodeDecodeError:
         logger.error(f"Failed to decode file {file_path} with encoding {encoding}")
         raise HTTPException(status_code=400, detail=f"Failed to decode file with {encoding} encoding")
@@ -226,16 +441,23 @@ async def read_root():
 @app.get("/voices", response_model=List[VoiceInfo])
 async def get_voices():
     """Get all available voices from Edge TTS"""
+    global _voices_response
     voices = await get_cached_voices()
-    formatted_voices = [
-        VoiceInfo(
-            name=voice["Name"],
-            gender=voice["Gender"],
-            locale=voice["Locale"]
-        )
-        for voice in voices
-    ]
-    return formatted_voices
+    
+    # Serialize only when the underlying voice list was refetched
+    if _voices_response is None or _voices_response[0] is not voices:
+        formatted_voices = [
+            {
+                "name": voice["Name"],
+                "gender": voice["Gender"],
+                "locale": voice["Locale"]
+            }
+            for voice in voices
+        ]
+        _voices_response = (voices, orjson.dumps(formatted_voices))
+    
+    # Return the cached bytes directly, bypassing response model serialization
+    return Response(content=_voices_response[1], media_type="application/json")
 
 @app.post("/upload", response_model=UploadResponse)
 @limiter.limit(settings.upload_rate_limit)
@@ -243,15 +465,16 @@ async def upload_file(
     request: Request,
     file: UploadFile = File(...),
     username: str = Depends(verify_credentials),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Upload a file for processing"""
     logger.info(f"File upload initiated by {username}: {file.filename}")
     
     # Validate file
-    await validate_file_size(file)
     await validate_file_type(file)
     
+    max_size = settings.max_file_size_mb * 1024 * 1024
+    
     try:
         # Generate a unique ID for the file
         file_id = str(uuid.uuid4())
@@ -262,45 +485,45 @@ async def upload_file(
         
         file_path = Path(settings.upload_dir) / f"{file_id}_{safe_filename}"
         
-        # Save the uploaded file
-        content = await file.read()
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            await out_file.write(content)
+        # Stream the upload to disk, enforcing the size limit and detecting the encoding as we go
+        file_size, result = await asyncio.to_thread(_save_upload, file.file, file_path, max_size)
         
-        # Detect encoding and convert to UTF-8 if necessary
-        result = chardet.detect(content)
-        encoding = result.get('encoding', 'utf-8')
-        confidence = result.get('confidence', 0)
+        if file_size > max_size:
+            await asyncio.to_thread(file_path.unlink, missing_ok=True)
+            raise HTTPException(
+                status_code=413, 
+                detail=f"File size exceeds maximum allowed size of {settings.max_file_size_mb}MB"
+            )
         
-        logger.info(f"File encoding detected: {encoding} (confidence: {confidence})")
+        encoding = result.get('encoding') or 'utf-8'
+        confidence = result.get('confidence') or 0
         
-        # Create UTF-8 version of the file
-        utf8_path = Path(settings.upload_dir) / f"{file_id}_utf8_{safe_filename}"
+        logger.info(f"File encoding detected: {encoding} (confidence: {confidence})")
         
-        if encoding and encoding.lower() != 'utf-8':
+        # Create UTF-8 version of the file; UTF-8 and ASCII uploads are used as-is
+        if encoding.lower() in ('utf-8', 'ascii'):
+            utf8_path = file_path
+        else:
+            utf8_path = Path(settings.upload_dir) / f"{file_id}_utf8_{safe_filename}"
             try:
-                decoded_content = content.decode(encoding)
-                async with aiofiles.open(utf8_path, 'w', encoding='utf-8') as utf8_file:
-                    await utf8_file.write(decoded_content)
+                await asyncio.to_thread(_convert_to_utf8, file_path, utf8_path, encoding)
             except Exception as e:
                 logger.error(f"Failed to convert file to UTF-8: {str(e)}")
                 raise HTTPException(status_code=400, detail=f"Failed to convert file to UTF-8: {str(e)}")
-        else:
-            # File is already UTF-8
-            async with aiofiles.open(utf8_path, 'wb') as utf8_file:
-                await utf8_file.write(content)
         
         # Save to database
         db_file = FileUpload(
             id=file_id,
             filename=safe_filename,
             original_filename=original_filename,
-            file_size=len(content),
+            file_size=file_size,
             encoding=encoding,
-            encoding_confidence=confidence
+            encoding_confidence=confidence,
+            stored_path=str(file_path),
+            utf8_path=str(utf8_path)
         )
         db.add(db_file)
-        db.commit()
+        await db.commit()
         
         logger.info(f"File uploaded successfully: {file_id}")
         
@@ -309,7 +532,7 @@ async def upload_file(
             filename=safe_filename,
             original_encoding=encoding,
             encoding_confidence=confidence,
-            size=len(content)
+            size=file_size
         )
         
     except HTTPException:
@@ -324,10 +547,11 @@ async def text_to_speech(
     request: Request,
     tts_request: TTSRequest,
     username: str = Depends(verify_credentials),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Convert text to speech"""
     logger.info(f"TTS request from {username}: voice={tts_request.voice}, text_length={len(tts_request.text)}")
+    validate_voice(tts_request.voice)
     
     output_id = str(uuid.uuid4())
     output_path = Path(settings.output_dir) / f"{output_id}.mp3"
@@ -354,7 +578,7 @@ async def text_to_speech(
             original_name=tts_request.filename or "text_to_speech.txt"
         )
         db.add(db_generation)
-        db.commit()
+        await db.commit()
         
         logger.info(f"TTS processing completed: {output_id}")
         
@@ -375,12 +599,12 @@ async def batch_process(
     request: Request,
     batch_request: BatchProcessRequest,
     username: str = Depends(verify_credentials),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Batch process multiple files"""
     logger.info(f"Batch processing request from {username}: {len(batch_request.file_ids)} files")
+    validate_voice(batch_request.voice)
     
-    output_files = []
     batch_id = str(uuid.uuid4())
     
     try:
@@ -394,62 +618,86 @@ async def batch_process(
             pitch=batch_request.pitch
         )
         db.add(db_batch)
-        db.commit()
         
+        # Fetch every upload in the batch with a single indexed query
+        uploads = await db.scalars(
+            select(FileUpload).where(
+                FileUpload.id.in_(batch_request.file_ids),
+                FileUpload.is_deleted.is_not(True)
+            )
+        )
+        uploads_by_id = {db_file.id: db_file for db_file in uploads}
+        
+        # Resolve every file up front so a missing one fails before any TTS work
+        items = []
         for file_id in batch_request.file_ids:
-            # Find the UTF-8 converted file
-            utf8_files = list(Path(settings.upload_dir).glob(f"{file_id}_utf8_*"))
+            db_file = uploads_by_id.get(file_id)
             
-            if not utf8_files:
+            if not db_file or not db_file.utf8_path:
                 logger.error(f"File not found: {file_id}")
                 raise HTTPException(status_code=404, detail=f"File {file_id} not found")
             
-            utf8_file = utf8_files[0]
-            
-            # Read the file content safely
-            text = await safe_file_read(utf8_file)
-            
-            # Create output file
-            output_id = str(uuid.uuid4())
-            output_path = Path(settings.output_dir) / f"{output_id}.mp3"
-            
-            # Process TTS
-            await process_text_to_speech(
-                text,
-                str(output_path),
-                batch_request.voice,
-                batch_request.rate,
-                batch_request.volume,
-                batch_request.pitch
-            )
-            
-            # Save to database
-            original_name = utf8_file.name.replace(f"{file_id}_utf8_", "")
-            db_generation = TTSGeneration(
-                output_id=output_id,
-                file_id=file_id,
-                voice=batch_request.voice,
-                text_length=len(text),
-                rate=batch_request.rate,
-                volume=batch_request.volume,
-                pitch=batch_request.pitch,
-                original_name=original_name,
-                is_batch=True,
-                batch_id=batch_id
-            )
-            db.add(db_generation)
+            items.append((file_id, db_file))
+        
+        # Bound concurrent Edge TTS calls so one batch cannot exhaust the upstream
+        sem = asyncio.Semaphore(settings.tts_concurrency)
+        
+        async def process_one(file_id: str, db_file: FileUpload) -> Tuple[dict, dict]:
+            async with sem:
+                # Read the file content safely
+                text = await safe_file_read(Path(db_file.utf8_path))
+                
+                # Create output file
+                output_id = str(uuid.uuid4())
+                output_path = Path(settings.output_dir) / f"{output_id}.mp3"
+                
+                # Process TTS
+                await process_text_to_speech(
+                    text,
+                    str(output_path),
+                    batch_request.voice,
+                    batch_request.rate,
+                    batch_request.volume,
+                    batch_request.pitch
+                )
             
-            # Add to output files
-            output_files.append({
+            original_name = db_file.filename
+            generation = {
+                "output_id": output_id,
+                "file_id": file_id,
+                "voice": batch_request.voice,
+                "text_length": len(text),
+                "rate": batch_request.rate,
+                "volume": batch_request.volume,
+                "pitch": batch_request.pitch,
+                "original_name": original_name,
+                "is_batch": True,
+                "batch_id": batch_id
+            }
+            output_file = {
                 "file_id": file_id,
                 "original_name": original_name,
                 "output_id": output_id,
                 "output_url": f"/outputs/{output_id}.mp3"
-            })
+            }
+            return generation, output_file
         
-        # Mark batch as completed
+        # Let every job finish so one failure doesn't leave the others running unobserved
+        results = await asyncio.gather(
+            *(process_one(file_id, db_file) for file_id, db_file in items),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        
+        # Save all generations with one multi-row INSERT
+        await db.execute(insert(TTSGeneration), [generation for generation, _ in results])
+        output_files = [output_file for _, output_file in results]
+        
+        # Mark batch as completed and persist everything in a single commit
         db_batch.is_completed = True
-        db.commit()
+        await db.commit()
         
         logger.info(f"Batch processing completed: {batch_id}")
         
@@ -474,36 +722,33 @@ async def create_zip(
     logger.info(f"ZIP creation request from {username}: {len(file_info.file_ids)} files")
     
     try:
-        # Create a buffer for the ZIP file
-        zip_buffer = io.BytesIO()
-        
-        # Create a ZIP file in the buffer
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for file_id in file_info.file_ids:
-                # Get the file path
-                file_path = Path(settings.output_dir) / f"{file_id}.mp3"
-                
-                if not file_path.exists():
-                    logger.warning(f"File not found for ZIP: {file_id}")
-                    continue
-                
-                # Add the file to the ZIP archive
-                zip_file.write(file_path, arcname=f"{file_id}.mp3")
+        # Build the archive lazily; MP3s are already compressed so store them as-is
+        zip_stream = ZipStream(compress_type=zipfile.ZIP_STORED, sized=True)
         
-        # Reset the buffer position to the beginning
-        zip_buffer.seek(0)
+        for file_id in file_info.file_ids:
+            # Get the file path
+            file_path = Path(settings.output_dir) / f"{file_id}.mp3"
+            
+            if not file_path.exists():
+                logger.warning(f"File not found for ZIP: {file_id}")
+                continue
+            
+            # Queue the file; it is only read while the response is streamed
+            zip_stream.add_path(file_path, arcname=f"{file_id}.mp3")
         
         # Create a unique ID for the ZIP file
         zip_id = str(uuid.uuid4())
         
         logger.info(f"ZIP file created: {zip_id}")
         
-        # Return the buffer as a streaming response
+        # Stream the archive chunk by chunk instead of buffering it in memory;
+        # stored entries make the final size known up front
         return StreamingResponse(
-            io.BytesIO(zip_buffer.read()),
+            zip_stream,
             media_type="application/zip",
             headers={
-                "Content-Disposition": f"attachment; filename=tts_batch_{zip_id}.zip"
+                "Content-Disposition": f"attachment; filename=tts_batch_{zip_id}.zip",
+                "Content-Length": str(len(zip_stream))
             }
         )
         
@@ -512,7 +757,7 @@ async def create_zip(
         raise HTTPException(status_code=500, detail=f"Failed to create ZIP file: {str(e)}")
 
 @app.get("/download/{output_id}")
-async def download_file(output_id: str, username: str = Depends(verify_credentials), db: Session = Depends(get_db)):
+async def download_file(output_id: str, username: str = Depends(verify_credentials), db: AsyncSession = Depends(get_db)):
     """Download processed audio file"""
     logger.info(f"Download request from {username}: {output_id}")
     
@@ -521,15 +766,19 @@ async def download_file(output_id: str, username: str = Depends(verify_credentia
     
     file_path = Path(settings.output_dir) / f"{clean_id}.mp3"
     
-    if not file_path.exists():
+    # Reuse this stat for the response instead of letting FileResponse stat again
+    try:
+        stat_result = file_path.stat()
+    except FileNotFoundError:
         logger.error(f"File not found: {clean_id}.mp3")
         raise HTTPException(status_code=404, detail=f"File not found: {clean_id}.mp3")
     
-    # Try to get original filename from database
-    db_generation = db.query(TTSGeneration).filter(TTSGeneration.output_id == clean_id).first()
+    # Try to get original filename from database (indexed lookup on the unique output_id)
+    original_name = await db.scalar(
+        select(TTSGeneration.original_name).where(TTSGeneration.output_id == clean_id)
+    )
     
-    if db_generation and db_generation.original_name:
-        original_name = db_generation.original_name
+    if original_name:
         if not original_name.lower().endswith('.mp3'):
             original_filename = Path(original_name).stem + '.mp3'
         else:
@@ -542,29 +791,31 @@ async def download_file(output_id: str, username: str = Depends(verify_credentia
     return FileResponse(
         path=file_path,
         filename=original_filename,
-        media_type="audio/mpeg"
+        media_type="audio/mpeg",
+        stat_result=stat_result
     )
 
 @app.delete("/file/{file_id}", response_model=SuccessResponse)
-async def delete_file(file_id: str, username: str = Depends(verify_credentials), db: Session = Depends(get_db)):
+async def delete_file(file_id: str, username: str = Depends(verify_credentials), db: AsyncSession = Depends(get_db)):
     """Delete an uploaded file"""
     logger.info(f"File deletion request from {username}: {file_id}")
     
-    # Find all files with this ID
-    files = list(Path(settings.upload_dir).glob(f"{file_id}*"))
+    db_file = await db.get(FileUpload, file_id)
     
-    if not files:
+    if not db_file or db_file.is_deleted:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # Delete all files with this ID
-    for file in files:
-        file.unlink()
+    def remove_files():
+        # Delete the uploaded file and its UTF-8 copy, which may be the same file
+        for path in {db_file.stored_path, db_file.utf8_path}:
+            if path:
+                Path(path).unlink(missing_ok=True)
+    
+    await asyncio.to_thread(remove_files)
     
     # Mark as deleted in database
-    db_file = db.query(FileUpload).filter(FileUpload.id == file_id).first()
-    if db_file:
-        db_file.is_deleted = True
-        db.commit()
+    db_file.is_deleted = True
+    await db.commit()
     
     logger.info(f"Files deleted: {file_id}")
     
@@ -574,22 +825,23 @@ async def delete_file(file_id: str, username: str = Depends(verify_credentials),
     )
 
 @app.delete("/output/{output_id}", response_model=SuccessResponse)
-async def delete_output(output_id: str, username: str = Depends(verify_credentials), db: Session = Depends(get_db)):
+async def delete_output(output_id: str, username: str = Depends(verify_credentials), db: AsyncSession = Depends(get_db)):
     """Delete a processed output file"""
     logger.info(f"Output deletion request from {username}: {output_id}")
     
     file_path = Path(settings.output_dir) / f"{output_id}.mp3"
     
-    if not file_path.exists():
+    # Unlink directly; a missing file surfaces as FileNotFoundError
+    try:
+        await asyncio.to_thread(file_path.unlink)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Output file not found")
     
-    file_path.unlink()
-    
     # Mark as deleted in database
-    db_generation = db.query(TTSGeneration).filter(TTSGeneration.output_id == output_id).first()
+    db_generation = await db.scalar(select(TTSGeneration).where(TTSGeneration.output_id == output_id))
     if db_generation:
         db_generation.is_deleted = True
-        db.commit()
+        await db.commit()
     
     logger.info(f"Output deleted: {output_id}")
     
@@ -599,28 +851,38 @@ async def delete_output(output_id: str, username: str = Depends(verify_credentia
     )
 
 @app.get("/uploads")
-async def list_uploads(username: str = Depends(verify_credentials)):
+async def list_uploads(username: str = Depends(verify_credentials), db: AsyncSession = Depends(get_db)):
     """List all uploaded files"""
     try:
-        files = [f.name for f in Path(settings.upload_dir).glob("*")]
+        # Uploads are tracked in the database, so no directory scan is needed
+        rows = await db.execute(
+            select(FileUpload.stored_path, FileUpload.utf8_path).where(FileUpload.is_deleted.is_not(True))
+        )
+        # UTF-8 uploads share one path for both columns; list each file once
+        files = [
+            Path(path).name
+            for stored_path, utf8_path in rows
+            for path in dict.fromkeys((stored_path, utf8_path))
+            if path
+        ]
         return {"files": files}
     except Exception as e:
         logger.error(f"Failed to list files: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to list files: {str(e)}")
 
 @app.get("/file-content/{file_id}", response_model=FileContentResponse)
-async def get_file_content_by_id(file_id: str, username: str = Depends(verify_credentials)):
+async def get_file_content_by_id(file_id: str, username: str = Depends(verify_credentials), db: AsyncSession = Depends(get_db)):
     """Get the content of a file by its ID"""
     logger.info(f"File content request from {username}: {file_id}")
     
     try:
-        # Find the UTF-8 converted file
-        utf8_files = list(Path(settings.upload_dir).glob(f"{file_id}_utf8_*"))
+        # Look up the UTF-8 converted file by primary key
+        db_file = await db.get(FileUpload, file_id)
         
-        if not utf8_files:
+        if not db_file or db_file.is_deleted or not db_file.utf8_path:
             raise HTTPException(status_code=404, detail=f"File {file_id} not found")
         
-        utf8_file = utf8_files[0]
+        utf8_file = Path(db_file.utf8_path)
         
         # Read the file content safely
         content = await safe_file_read(utf8_file)
@@ -628,12 +890,9 @@ async def get_file_content_by_id(file_id: str, username: str = Depends(verify_cr
         # Get file stats
         file_stats = utf8_file.stat()
         
-        # Get the original filename without the prefix
-        original_name = utf8_file.name.replace(f"{file_id}_utf8_", "")
-        
         return FileContentResponse(
             content=content,
-            filename=original_name,
+            filename=db_file.filename,
             file_size=file_stats.st_size,
             encoding="utf-8"
         )
@@ -650,37 +909,46 @@ async def cleanup_old_files():
     try:
         logger.info("Starting file cleanup...")
         
-        # Get the current time
-        now = datetime.utcnow()
-        
-        # Clean up files older than specified days
+        # Files last modified before this epoch timestamp are removed
         max_age = timedelta(days=settings.max_file_age_days)
-        
-        cleanup_count = 0
-        
-        # Clean up uploaded files
-        for file_path in Path(settings.upload_dir).glob("*"):
-            if file_path.is_file():
-                file_age = now - datetime.fromtimestamp(file_path.stat().st_mtime)
-                if file_age > max_age:
-                    file_path.unlink()
-                    cleanup_count += 1
-        
-        # Clean up output files
-        for file_path in Path(settings.output_dir).glob("*"):
-            if file_path.is_file():
-                file_age = now - datetime.fromtimestamp(file_path.stat().st_mtime)
-                if file_age > max_age:
-                    file_path.unlink()
-                    cleanup_count += 1
-        
-        # Clean up temp files
-        for file_path in Path(settings.temp_dir).glob("*"):
-            if file_path.is_file():
-                file_age = now - datetime.fromtimestamp(file_path.stat().st_mtime)
-                if file_age > max_age:
-                    file_path.unlink()
-                    cleanup_count += 1
+        cutoff = time.time() - max_age.total_seconds()
+        
+        def sweep(directory: str) -> List[str]:
+            removed = []
+            # scandir yields cached entry types, so only one stat per file is needed
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file(follow_symlinks=False) and entry.stat().st_mtime < cutoff:
+                        os.unlink(entry.path)
+                        # Normalise to the form stored in the database, e.g. "./uploads/x" -> "uploads/x"
+                        removed.append(str(Path(entry.path)))
+            return removed
+        
+        # Sweep upload, output, temp and TTS cache directories in parallel worker threads
+        removed_uploads, removed_outputs, *removed_other = await asyncio.gather(*(
+            asyncio.to_thread(sweep, directory)
+            for directory in (settings.upload_dir, settings.output_dir, settings.temp_dir, settings.tts_cache_dir)
+        ))
+        cleanup_count = len(removed_uploads) + len(removed_outputs) + sum(map(len, removed_other))
+        
+        # Mark the records of removed files deleted so listings and lookups stop returning them
+        removed_output_ids = [Path(path).stem for path in removed_outputs]
+        async with AsyncSessionMaker() as db:
+            # Batch the IN lists to stay under SQLite's bound-parameter limit
+            for i in range(0, len(removed_uploads), CLEANUP_BATCH_SIZE):
+                paths = removed_uploads[i:i + CLEANUP_BATCH_SIZE]
+                await db.execute(
+                    update(FileUpload)
+                    .where(or_(FileUpload.stored_path.in_(paths), FileUpload.utf8_path.in_(paths)))
+                    .values(is_deleted=True)
+                )
+            for i in range(0, len(removed_output_ids), CLEANUP_BATCH_SIZE):
+                await db.execute(
+                    update(TTSGeneration)
+                    .where(TTSGeneration.output_id.in_(removed_output_ids[i:i + CLEANUP_BATCH_SIZE]))
+                    .values(is_deleted=True)
+                )
+            await db.commit()
         
         logger.info(f"Cleanup completed: {cleanup_count} files removed")
         
@@ -725,5 +993,9 @@ if __name__ == "__main__":
         "main:app",
         host=settings.api_host,
         port=settings.api_port,
-        reload=True
-    ) 
\ No newline at end of file
+        # uvloop has no Windows build; let uvicorn pick the default loop there
+        loop="uvloop" if sys.platform != "win32" else "auto",
+        http="httptools",
+        workers=settings.workers,
+        reload=settings.reload
+    )
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, validator, Field
+from pydantic import BaseModel, ConfigDict, field_validator, Field
 from typing import List, Optional
 import re
 
@@ -11,66 +11,77 @@ except ImportError:
         max_text_length = 10000
     settings = MockSettings()
 
+# Validation patterns, compiled once at import instead of on every request
+_UNSAFE_TEXT_RE = re.compile(r'[<>\"\'&]')
+_FILENAME_BAD_RE = re.compile(r'[^\w\-_\.]')
+_VOICE_RE = re.compile(r'^[a-zA-Z0-9\-_]+$')
+_FILE_ID_RE = re.compile(r'^[a-f0-9\-]{36}$')  # UUID format
+
 class TTSRequest(BaseModel):
     text: str = Field(..., min_length=1, max_length=settings.max_text_length)
     voice: str = Field(..., min_length=1)
-    rate: Optional[str] = Field("+0%", regex=r"^[+-]\d+%$")
-    volume: Optional[str] = Field("+0%", regex=r"^[+-]\d+%$")
-    pitch: Optional[str] = Field("+0Hz", regex=r"^[+-]\d+Hz$")
+    rate: Optional[str] = Field("+0%", pattern=r"^[+-]\d+%$")
+    volume: Optional[str] = Field("+0%", pattern=r"^[+-]\d+%$")
+    pitch: Optional[str] = Field("+0Hz", pattern=r"^[+-]\d+Hz$")
     filename: Optional[str] = None
 
-    @validator('text')
+    @field_validator('text')
+    @classmethod
     def validate_text(cls, v):
         """Sanitize text input"""
         if not v.strip():
             raise ValueError("Text cannot be empty")
         # Remove potential malicious content but preserve basic formatting
-        cleaned = re.sub(r'[<>\"\'&]', '', v)
+        cleaned = _UNSAFE_TEXT_RE.sub('', v)
         return cleaned.strip()
 
-    @validator('filename')
+    @field_validator('filename')
+    @classmethod
     def validate_filename(cls, v):
         """Sanitize filename"""
         if v:
             # Remove invalid filename characters
-            sanitized = re.sub(r'[^\w\-_\.]', '_', v)
+            sanitized = _FILENAME_BAD_RE.sub('_', v)
             # Ensure filename isn't too long
             if len(sanitized) > 255:
                 sanitized = sanitized[:251] + ".txt"
             return sanitized
         return v
 
-    @validator('voice')
+    @field_validator('voice')
+    @classmethod
     def validate_voice(cls, v):
         """Ensure voice name is not empty and contains valid characters"""
         if not v.strip():
             raise ValueError("Voice cannot be empty")
         # Basic validation for voice name format
-        if not re.match(r'^[a-zA-Z0-9\-_]+$', v):
+        if not _VOICE_RE.match(v):
             raise ValueError("Invalid voice name format")
         return v
 
 class BatchProcessRequest(BaseModel):
-    file_ids: List[str] = Field(..., min_items=1, max_items=50)
+    file_ids: List[str] = Field(..., min_length=1, max_length=50)
     voice: str = Field(..., min_length=1)
-    rate: Optional[str] = Field("+0%", regex=r"^[+-]\d+%$")
-    volume: Optional[str] = Field("+0%", regex=r"^[+-]\d+%$")
-    pitch: Optional[str] = Field("+0Hz", regex=r"^[+-]\d+Hz$")
+    rate: Optional[str] = Field("+0%", pattern=r"^[+-]\d+%$")
+    volume: Optional[str] = Field("+0%", pattern=r"^[+-]\d+%$")
+    pitch: Optional[str] = Field("+0Hz", pattern=r"^[+-]\d+Hz$")
 
-    @validator('file_ids')
+    @field_validator('file_ids')
+    @classmethod
     def validate_file_ids(cls, v):
         """Validate file IDs format"""
         for file_id in v:
-            if not re.match(r'^[a-f0-9\-]{36}$', file_id):  # UUID format
+            if not _FILE_ID_RE.match(file_id):
                 raise ValueError(f"Invalid file ID format: {file_id}")
         return v
 
-    @validator('voice')
+    @field_validator('voice')
+    @classmethod
     def validate_voice(cls, v):
         """Ensure voice name is valid"""
         if not v.strip():
             raise ValueError("Voice cannot be empty")
-        if not re.match(r'^[a-zA-Z0-9\-_]+$', v):
+        if not _VOICE_RE.match(v):
             raise ValueError("Invalid voice name format")
         return v
 
@@ -79,23 +90,25 @@ class VoiceInfo(BaseModel):
     gender: str
     locale: str
 
-    class Config:
-        schema_extra = {
+    model_config = ConfigDict(
+        json_schema_extra={
             "example": {
                 "name": "en-US-AndrewNeural",
                 "gender": "Male",
                 "locale": "en-US"
             }
         }
+    )
 
 class ProcessedFilesInfo(BaseModel):
-    file_ids: List[str] = Field(..., min_items=1, max_items=100)
+    file_ids: List[str] = Field(..., min_length=1, max_length=100)
 
-    @validator('file_ids')
+    @field_validator('file_ids')
+    @classmethod
     def validate_file_ids(cls, v):
         """Validate file IDs format"""
         for file_id in v:
-            if not re.match(r'^[a-f0-9\-]{36}$', file_id):  # UUID format
+            if not _FILE_ID_RE.match(file_id):
                 raise ValueError(f"Invalid file ID format: {file_id}")
         return v
 
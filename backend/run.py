@@ -1,4 +1,17 @@
+import sys
+
 import uvicorn
 
+from config import settings
+
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    uvicorn.run(
+        "main:app",
+        host=settings.api_host,
+        port=settings.api_port,
+        # uvloop has no Windows build; let uvicorn pick the default loop there
+        loop="uvloop" if sys.platform != "win32" else "auto",
+        http="httptools",
+        workers=settings.workers,
+        reload=settings.reload
+    )
@@ -1,60 +1,63 @@
 import pytest
+import os
 import asyncio
+import base64
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-import tempfile
-import os
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
 from pathlib import Path
 
 from main import app
 from database import get_db, Base
 from config import settings
 
-# Create a test database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
-TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Create an in-memory test database; StaticPool keeps the single connection
+# (and with it the data) shared by every session
+SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite://"
+engine = create_async_engine(
+    SQLALCHEMY_DATABASE_URL,
+    connect_args={"check_same_thread": False},
+    poolclass=StaticPool,
+)
+TestingSessionLocal = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
 
 # Override the get_db dependency
-def override_get_db():
-    try:
-        db = TestingSessionLocal()
+async def override_get_db():
+    async with TestingSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 app.dependency_overrides[get_db] = override_get_db
 
 # Create test client
 client = TestClient(app)
 
-@pytest.fixture(scope="module")
+@pytest.fixture(scope="session")
 def setup_database():
     """Setup test database"""
-    Base.metadata.create_all(bind=engine)
+    # The app creates these in its lifespan, which the module-level client does not run
+    for directory in [settings.upload_dir, settings.output_dir, settings.temp_dir, settings.tts_cache_dir]:
+        Path(directory).mkdir(exist_ok=True)
+    
+    async def run(fn):
+        async with engine.begin() as conn:
+            await conn.run_sync(fn)
+
+    asyncio.run(run(Base.metadata.create_all))
     yield
-    Base.metadata.drop_all(bind=engine)
+    asyncio.run(run(Base.metadata.drop_all))
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 def auth_headers():
     """Return basic auth headers for testing"""
-    import base64
     credentials = base64.b64encode(f"{settings.auth_username}:{settings.auth_password}".encode()).decode()
     return {"Authorization": f"Basic {credentials}"}
 
 @pytest.fixture
-def test_file():
+def test_file(tmp_path):
     """Create a temporary test file"""
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
-        f.write("This is a test file for TTS conversion.")
-        temp_path = f.name
-    
-    yield temp_path
-    
-    # Cleanup
-    if os.path.exists(temp_path):
-        os.unlink(temp_path)
+    temp_path = tmp_path / "test.txt"
+    temp_path.write_text("This is a test file for TTS conversion.")
+    return temp_path
 
 class TestAPI:
     """Test class for API endpoints"""
@@ -93,7 +96,7 @@ class TestAPI:
         with open(test_file, 'rb') as f:
             response = client.post(
                 "/upload", 
-                files={"file": (os.path.basename(test_file), f, "text/plain")},
+                files={"file": (test_file.name, f, "text/plain")},
                 headers=auth_headers
             )
         assert response.status_code == 200
@@ -103,43 +106,34 @@ class TestAPI:
         assert "original_encoding" in data
         assert "size" in data
 
-    def test_upload_invalid_file_type(self, setup_database, auth_headers):
+    def test_upload_invalid_file_type(self, setup_database, auth_headers, tmp_path):
         """Test upload with invalid file type"""
         # Create a fake binary file
-        with tempfile.NamedTemporaryFile(suffix='.exe', delete=False) as f:
-            f.write(b'\x00\x01\x02\x03')
-            temp_path = f.name
-        
-        try:
-            with open(temp_path, 'rb') as f:
-                response = client.post(
-                    "/upload",
-                    files={"file": (os.path.basename(temp_path), f, "application/octet-stream")},
-                    headers=auth_headers
-                )
-            assert response.status_code == 400
-        finally:
-            os.unlink(temp_path)
-
-    def test_upload_large_file(self, setup_database, auth_headers):
+        temp_path = tmp_path / "test.exe"
+        temp_path.write_bytes(b'\x00\x01\x02\x03')
+        
+        with open(temp_path, 'rb') as f:
+            response = client.post(
+                "/upload",
+                files={"file": (temp_path.name, f, "application/octet-stream")},
+                headers=auth_headers
+            )
+        assert response.status_code == 400
+
+    def test_upload_large_file(self, setup_database, auth_headers, tmp_path):
         """Test upload with file too large"""
-        # Create a file larger than the limit
-        large_content = "x" * (settings.max_file_size_mb * 1024 * 1024 + 1)
-        
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
-            f.write(large_content)
-            temp_path = f.name
-        
-        try:
-            with open(temp_path, 'rb') as f:
-                response = client.post(
-                    "/upload",
-                    files={"file": (os.path.basename(temp_path), f, "text/plain")},
-                    headers=auth_headers
-                )
-            assert response.status_code == 413
-        finally:
-            os.unlink(temp_path)
+        # Create a sparse file one byte over the limit without writing its contents
+        temp_path = tmp_path / "large.txt"
+        with open(temp_path, 'wb') as f:
+            f.truncate(settings.max_file_size_mb * 1024 * 1024 + 1)
+        
+        with open(temp_path, 'rb') as f:
+            response = client.post(
+                "/upload",
+                files={"file": (temp_path.name, f, "text/plain")},
+                headers=auth_headers
+            )
+        assert response.status_code == 413
 
     def test_tts_without_auth(self):
         """Test TTS without authentication"""
@@ -185,6 +179,16 @@ class TestAPI:
         }, headers=auth_headers)
         assert response.status_code == 422
 
+    def test_tts_unknown_voice(self, auth_headers, monkeypatch):
+        """Test TTS rejects voices missing from the loaded voice list"""
+        import main
+        monkeypatch.setattr(main, "_valid_voices", frozenset({"en-US-AndrewNeural"}))
+        response = client.post("/tts", json={
+            "text": "Hello",
+            "voice": "xx-XX-MadeUpNeural"
+        }, headers=auth_headers)
+        assert response.status_code == 400
+
     def test_batch_process_without_auth(self):
         """Test batch processing without authentication"""
         response = client.post("/batch-process", json={
@@ -195,8 +199,9 @@ class TestAPI:
 
     def test_batch_process_nonexistent_files(self, setup_database, auth_headers):
         """Test batch processing with nonexistent files"""
+        import uuid
         response = client.post("/batch-process", json={
-            "file_ids": ["nonexistent-id"],
+            "file_ids": [str(uuid.uuid4())],
             "voice": "en-US-AndrewNeural"
         }, headers=auth_headers)
         assert response.status_code == 404
@@ -223,6 +228,72 @@ class TestAPI:
         assert "files" in data
         assert isinstance(data["files"], list)
 
+    def test_cleanup_marks_uploads_deleted(self, setup_database, auth_headers, test_file, tmp_path, monkeypatch):
+        """Test files removed by the cleanup sweep disappear from the upload listing"""
+        import main
+        
+        monkeypatch.setattr(main, "AsyncSessionMaker", TestingSessionLocal)
+        for name in ("upload_dir", "output_dir", "temp_dir", "tts_cache_dir"):
+            directory = tmp_path / name
+            directory.mkdir()
+            monkeypatch.setattr(settings, name, str(directory))
+        
+        with open(test_file, 'rb') as f:
+            response = client.post(
+                "/upload",
+                files={"file": (test_file.name, f, "text/plain")},
+                headers=auth_headers
+            )
+        assert response.status_code == 200
+        file_id = response.json()["file_id"]
+        
+        # Age the upload past the retention window
+        for path in Path(settings.upload_dir).iterdir():
+            os.utime(path, (0, 0))
+        asyncio.run(main.cleanup_old_files())
+        
+        response = client.get("/uploads", headers=auth_headers)
+        assert response.status_code == 200
+        assert not any(name.startswith(file_id) for name in response.json()["files"])
+        
+        response = client.get(f"/file-content/{file_id}", headers=auth_headers)
+        assert response.status_code == 404
+
+    def test_legacy_upload_backfill(self, setup_database, auth_headers, tmp_path, monkeypatch):
+        """Test uploads recorded before paths were stored are backfilled from the upload directory"""
+        import main
+        from database import FileUpload
+        
+        monkeypatch.setattr(main, "AsyncSessionMaker", TestingSessionLocal)
+        monkeypatch.setattr(settings, "upload_dir", str(tmp_path))
+        file_id, gone_id = "legacy-upload", "legacy-gone"
+        (tmp_path / f"{file_id}_old.txt").write_text("Legacy upload.")
+        (tmp_path / f"{file_id}_utf8_old.txt").write_text("Legacy upload.")
+        
+        async def add_rows():
+            async with TestingSessionLocal() as db:
+                for row_id in (file_id, gone_id):
+                    db.add(FileUpload(id=row_id, filename="old.txt", original_filename="old.txt", file_size=14))
+                await db.commit()
+        
+        asyncio.run(add_rows())
+        asyncio.run(main.backfill_upload_paths())
+        
+        files = set(client.get("/uploads", headers=auth_headers).json()["files"])
+        assert {f"{file_id}_old.txt", f"{file_id}_utf8_old.txt"} <= files
+        
+        response = client.get(f"/file-content/{file_id}", headers=auth_headers)
+        assert response.status_code == 200
+        assert response.json()["content"] == "Legacy upload."
+        
+        # A row whose files were already removed is marked deleted
+        response = client.get(f"/file-content/{gone_id}", headers=auth_headers)
+        assert response.status_code == 404
+        
+        response = client.delete(f"/file/{file_id}", headers=auth_headers)
+        assert response.status_code == 200
+        assert not any(tmp_path.iterdir())
+
     def test_create_zip_without_auth(self):
         """Test ZIP creation without authentication"""
         response = client.post("/create-zip", json={
@@ -292,25 +363,65 @@ class TestUtilities:
     """Test utility functions"""
     
     @pytest.mark.asyncio
-    async def test_safe_file_read(self):
+    async def test_safe_file_read(self, tmp_path):
         """Test safe file reading with size limits"""
         from main import safe_file_read
         
         # Create a test file
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False) as f:
-            f.write("This is a test file.")
-            temp_path = Path(f.name)
-        
-        try:
-            # Test normal read
-            content = await safe_file_read(temp_path)
-            assert content == "This is a test file."
+        temp_path = tmp_path / "test.txt"
+        temp_path.write_text("This is a test file.")
+        
+        # Test normal read
+        content = await safe_file_read(temp_path)
+        assert content == "This is a test file."
+        
+        # Test size limit
+        with pytest.raises(Exception):  # Should raise HTTPException
+            await safe_file_read(temp_path, max_size=5)
+
+    def test_add_missing_columns(self):
+        """Test columns added to a model are created on an existing table"""
+        from sqlalchemy import create_engine, inspect, text
+        from database import add_missing_columns
+        
+        sync_engine = create_engine("sqlite://")
+        with sync_engine.begin() as conn:
+            conn.execute(text("CREATE TABLE file_uploads (id VARCHAR PRIMARY KEY, filename VARCHAR)"))
+            Base.metadata.create_all(conn)
+            add_missing_columns(conn)
+            # Running it again on an up-to-date schema is a no-op
+            add_missing_columns(conn)
+            columns = {column["name"] for column in inspect(conn).get_columns("file_uploads")}
+        
+        assert {"stored_path", "utf8_path", "is_deleted"} <= columns
+
+    @pytest.mark.asyncio
+    async def test_tts_cache_reuses_output(self, monkeypatch, tmp_path):
+        """Test identical TTS requests are served from the content-hash cache"""
+        import main
+        
+        calls = []
+        
+        class FakeCommunicate:
+            def __init__(self, text, voice, **kwargs):
+                calls.append(text)
             
-            # Test size limit
-            with pytest.raises(Exception):  # Should raise HTTPException
-                await safe_file_read(temp_path, max_size=5)
-        finally:
-            temp_path.unlink()
+            async def save(self, output_file):
+                Path(output_file).write_bytes(b"fake mp3")
+        
+        monkeypatch.setattr(main.edge_tts, "Communicate", FakeCommunicate)
+        
+        monkeypatch.setattr(settings, "tts_cache_dir", str(tmp_path))
+        first = tmp_path / "first.mp3"
+        second = tmp_path / "second.mp3"
+        
+        await main.process_text_to_speech("Hello", str(first), "en-US-AndrewNeural", "+0%", "+0%", "+0Hz")
+        await main.process_text_to_speech("Hello", str(second), "en-US-AndrewNeural", "+0%", "+0%", "+0Hz")
+        
+        assert calls == ["Hello"]
+        assert second.read_bytes() == b"fake mp3"
+        # Each output is its own file, so it ages independently of the cache entry
+        assert not os.path.samefile(first, second)
 
 if __name__ == "__main__":
     pytest.main([__file__]) 
\ No newline at end of file
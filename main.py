@@ -1,22 +1,28 @@
 import os
-import chardet
-import nltk
+import codecs
 import tempfile
 import asyncio
-import aiofiles
-import uuid
+import secrets
 import logging
+import time
 from datetime import datetime
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
-from fastapi.responses import FileResponse
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi.responses import FileResponse, ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, validator
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import Annotated, Dict, List, NamedTuple, Optional, Tuple
 import edge_tts
+import orjson
 import shutil
 from pathlib import Path
 from fastapi.staticfiles import StaticFiles
 
+# Prefer the C implementation of the encoding detector when available
+try:
+    import cchardet as chardet_fast
+except ImportError:
+    import chardet as chardet_fast
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -28,13 +34,10 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Download NLTK data if it doesn't exist
-try:
-    nltk.data.find('tokenizers/punkt')
-except LookupError:
-    nltk.download('punkt')
+app = FastAPI(title="Edge TTS Web Interface", default_response_class=ORJSONResponse)
 
-app = FastAPI(title="Edge TTS Web Interface")
+# Static health-check payload, serialized once
+ROOT_BODY = orjson.dumps({"message": "Edge TTS Web API is running"})
 
 # Setup CORS
 app.add_middleware(
@@ -53,53 +56,78 @@ TEMP_DIR = Path("temp")
 for directory in [UPLOAD_DIR, OUTPUT_DIR, TEMP_DIR]:
     directory.mkdir(exist_ok=True)
 
+# Buffer size for file reads/writes (the 8 KiB default means many more syscalls)
+IO_BUFSIZE = 256 * 1024
+
+# Uploads are limited to 10MB and streamed to disk in chunks of this size
+MAX_FILE_SIZE = 10 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+
+def new_id() -> str:
+    """Generate a random 32-character hex identifier for uploads and outputs"""
+    return secrets.token_hex(16)
+
+# Chunk size used when re-encoding uploads as UTF-8
+DECODE_CHUNK_SIZE = 64 * 1024
+
+# Original upload names of batch outputs, keyed by output ID, used for download filenames
+output_names: Dict[str, str] = {}
+
+class UploadRecord(NamedTuple):
+    raw_path: Path
+    utf8_path: Path
+
+def load_upload_records() -> Dict[str, UploadRecord]:
+    """Rebuild the upload index from a single scan of the upload directory"""
+    names: Dict[str, set] = {}
+    with os.scandir(UPLOAD_DIR) as it:
+        for entry in it:
+            file_id, _, name = entry.name.partition("_")
+            names.setdefault(file_id, set()).add(name)
+    
+    # Each upload is stored as {file_id}_{name} alongside its copy {file_id}_utf8_{name}
+    records = {}
+    for file_id, stored in names.items():
+        for name in stored:
+            if f"utf8_{name}" in stored:
+                records[file_id] = UploadRecord(
+                    UPLOAD_DIR / f"{file_id}_{name}",
+                    UPLOAD_DIR / f"{file_id}_utf8_{name}"
+                )
+    return records
+
+# Uploaded files keyed by file ID, so lookups never have to scan the directory
+uploads: Dict[str, UploadRecord] = load_upload_records()
+
+# Maximum number of concurrent Edge TTS requests per batch
+TTS_CONCURRENCY = 8
+
+# Serialized voice list cache: (fetched_at, JSON bytes), refreshed every VOICES_CACHE_TTL seconds
+VOICES_CACHE_TTL = 3600
+_voices_cache: Optional[Tuple[float, bytes]] = None
+_voices_lock = asyncio.Lock()
+
 # Serve static files
 app.mount("/outputs", StaticFiles(directory="outputs"), name="outputs")
 
 # Models
+# Prosody settings are checked by compiled patterns in pydantic-core, not Python validators
+Percentage = Annotated[str, Field(pattern=r"^[+-]\d+%$")]
+Frequency = Annotated[str, Field(pattern=r"^[+-]\d+Hz$")]
+
 class TTSRequest(BaseModel):
     text: str
     voice: str
-    rate: Optional[str] = "+0%"
-    volume: Optional[str] = "+0%"
-    pitch: Optional[str] = "+0Hz"
-
-    @validator('rate')
-    def validate_rate(cls, v):
-        if not v.endswith('%'):
-            raise ValueError('Rate must end with %')
-        try:
-            int(v[:-1])
-        except ValueError:
-            raise ValueError('Rate must be a valid percentage')
-        return v
-
-    @validator('volume')
-    def validate_volume(cls, v):
-        if not v.endswith('%'):
-            raise ValueError('Volume must end with %')
-        try:
-            int(v[:-1])
-        except ValueError:
-            raise ValueError('Volume must be a valid percentage')
-        return v
-
-    @validator('pitch')
-    def validate_pitch(cls, v):
-        if not v.endswith('Hz'):
-            raise ValueError('Pitch must end with Hz')
-        try:
-            int(v[:-2])
-        except ValueError:
-            raise ValueError('Pitch must be a valid frequency')
-        return v
+    rate: Percentage = "+0%"
+    volume: Percentage = "+0%"
+    pitch: Frequency = "+0Hz"
 
 class BatchProcessRequest(BaseModel):
     file_ids: List[str]
     voice: str
-    rate: Optional[str] = "+0%"
-    volume: Optional[str] = "+0%"
-    pitch: Optional[str] = "+0Hz"
+    rate: Percentage = "+0%"
+    volume: Percentage = "+0%"
+    pitch: Frequency = "+0Hz"
 
 class VoiceInfo(BaseModel):
     name: str
@@ -108,21 +136,100 @@ class VoiceInfo(BaseModel):
 
 @app.get("/")
 async def read_root():
-    return {"message": "Edge TTS Web API is running"}
+    return Response(content=ROOT_BODY, media_type="application/json")
 
-@app.get("/voices")
+@app.get("/voices", response_model=List[VoiceInfo])
 async def get_voices():
     """Get all available voices from Edge TTS"""
-    voices = await edge_tts.list_voices()
-    formatted_voices = [
-        VoiceInfo(
-            name=voice["Name"],
-            gender=voice["Gender"],
-            locale=voice["Locale"]
-        )
-        for voice in voices
-    ]
-    return formatted_voices
+    global _voices_cache
+    
+    if _voices_cache and time.monotonic() - _voices_cache[0] < VOICES_CACHE_TTL:
+        return Response(content=_voices_cache[1], media_type="application/json")
+    
+    # Only one request refetches; the others wait and reuse its result
+    async with _voices_lock:
+        if not (_voices_cache and time.monotonic() - _voices_cache[0] < VOICES_CACHE_TTL):
+            voices = await edge_tts.list_voices()
+            # Serialize once per refresh; plain dicts skip building a model per voice
+            formatted_voices = [
+                {"name": voice["Name"], "gender": voice["Gender"], "locale": voice["Locale"]}
+                for voice in voices
+            ]
+            _voices_cache = (time.monotonic(), orjson.dumps(formatted_voices))
+    
+    return Response(content=_voices_cache[1], media_type="application/json")
+
+def save_upload_file(src, dst: Path, max_size: int) -> Tuple[int, bytes, bool]:
+    """Copy an upload stream to disk in chunks, returning its size, an encoding sample
+    and whether the whole file is valid UTF-8
+    
+    The sample is the first chunk, or the first chunk with non-ASCII bytes when the
+    head is plain ASCII, or the first chunk that breaks UTF-8, so detection never has
+    to read the file back.
+    Stops as soon as the size exceeds max_size; the caller must check the returned size.
+    """
+    size = 0
+    sample = b''
+    utf8_check = codecs.getincrementaldecoder('utf-8')()
+    is_utf8 = True
+    with open(dst, 'wb', buffering=IO_BUFSIZE) as out_file:
+        while chunk := src.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                break
+            chunk_is_ascii = chunk.isascii()
+            if not sample or (sample.isascii() and not chunk_is_ascii):
+                sample = chunk
+            # A pending partial character must still be completed by the next chunk
+            if is_utf8 and (not chunk_is_ascii or utf8_check.getstate()[0]):
+                try:
+                    utf8_check.decode(chunk)
+                except UnicodeDecodeError:
+                    is_utf8 = False
+                    sample = chunk
+            out_file.write(chunk)
+    # A file ending mid-character is not valid UTF-8 either
+    return size, sample, is_utf8 and not utf8_check.getstate()[0]
+
+def detect_encoding(sample: bytes, is_utf8: bool) -> dict:
+    """Detect the encoding of an upload from the sample taken while saving it"""
+    if not sample:
+        return {'encoding': None, 'confidence': 0.0}
+    
+    # A byte order mark settles the question without running the detector
+    if is_utf8 and sample.startswith(codecs.BOM_UTF8):
+        return {'encoding': 'utf-8-sig', 'confidence': 1.0}
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return {'encoding': 'utf-16', 'confidence': 1.0}
+    
+    # An ASCII sample means no chunk of the file had a non-ASCII byte
+    if sample.isascii():
+        return {'encoding': 'ascii', 'confidence': 1.0}
+    
+    # Valid UTF-8 throughout needs no statistical guess
+    if is_utf8:
+        return {'encoding': 'utf-8', 'confidence': 1.0}
+    
+    result = chardet_fast.detect(sample)
+    # The detector may still call a partly valid chunk UTF-8, which the full check ruled out
+    if result['encoding'] and result['encoding'].lower() in ('utf-8', 'utf-8-sig', 'ascii'):
+        return {'encoding': None, 'confidence': 0.0}
+    return result
+
+def link_or_copy(src: Path, dst: Path) -> None:
+    """Hard-link src to dst, copying instead on filesystems without hard links"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+def convert_file_to_utf8(src: Path, dst: Path, encoding: str, errors: str = 'strict'):
+    """Re-encode a file as UTF-8 chunk by chunk, never holding the whole text"""
+    with open(src, 'rb', buffering=IO_BUFSIZE) as raw_file, \
+            open(dst, 'w', encoding='utf-8', buffering=IO_BUFSIZE) as utf8_file:
+        reader = codecs.getreader(encoding)(raw_file, errors)
+        while chunk := reader.read(DECODE_CHUNK_SIZE):
+            utf8_file.write(chunk)
 
 @app.post("/upload")
 async def upload_file(file: UploadFile = File(...)):
@@ -130,54 +237,46 @@ async def upload_file(file: UploadFile = File(...)):
     if not file.filename:
         raise HTTPException(status_code=400, detail="No file provided")
     
-    # Check file size (limit to 10MB)
-    MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-    content = await file.read()
-    if len(content) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="File too large. Maximum size is 10MB")
-    
     # Generate a unique ID for the file
-    file_id = str(uuid.uuid4())
+    file_id = new_id()
     file_path = UPLOAD_DIR / f"{file_id}_{file.filename}"
     
+    # Stream the upload to disk, giving up as soon as it exceeds the size limit
+    size, sample, is_utf8 = await asyncio.to_thread(save_upload_file, file.file, file_path, MAX_FILE_SIZE)
+    if size > MAX_FILE_SIZE:
+        await asyncio.to_thread(file_path.unlink)
+        raise HTTPException(status_code=413, detail="File too large. Maximum size is 10MB")
+    
     try:
-        # Save the uploaded file
-        async with aiofiles.open(file_path, 'wb') as out_file:
-            await out_file.write(content)
-        
         logger.info(f"File uploaded successfully: {file.filename}")
         
         # Detect encoding and convert to UTF-8 if necessary
-        rawdata = open(file_path, 'rb').read()
-        result = chardet.detect(rawdata)
+        result = await asyncio.to_thread(detect_encoding, sample, is_utf8)
         encoding = result['encoding']
         
-        # Create UTF-8 version of the file
-        with open(file_path, 'rb') as file:
-            content = file.read()
+        utf8_path = UPLOAD_DIR / f"{file_id}_utf8_{file.filename}"
         
-        # If the file is not UTF-8, convert it
-        if encoding and encoding.lower() != 'utf-8':
+        # If the whole file is not valid UTF-8 (ASCII is a subset), convert it
+        if not is_utf8:
+            # With no usable guess, keep the valid UTF-8 and replace the undecodable bytes
+            source_encoding, errors = (encoding, 'strict') if encoding else ('utf-8', 'replace')
             try:
-                decoded_content = content.decode(encoding)
-                utf8_path = UPLOAD_DIR / f"{file_id}_utf8_{file.filename}"
-                with open(utf8_path, 'w', encoding='utf-8') as utf8_file:
-                    utf8_file.write(decoded_content)
-                logger.info(f"File converted from {encoding} to UTF-8")
+                await asyncio.to_thread(convert_file_to_utf8, file_path, utf8_path, source_encoding, errors)
+                logger.info(f"File converted from {source_encoding} to UTF-8")
             except Exception as e:
                 logger.error(f"Failed to convert file to UTF-8: {str(e)}", exc_info=True)
                 raise HTTPException(status_code=500, detail=f"Failed to convert file to UTF-8: {str(e)}")
         else:
-            # File is already UTF-8, just create a copy with the expected name
-            utf8_path = UPLOAD_DIR / f"{file_id}_utf8_{file.filename}"
-            with open(utf8_path, 'wb') as utf8_file:
-                utf8_file.write(content)
+            # File is already UTF-8, just expose it under the expected name
+            await asyncio.to_thread(link_or_copy, file_path, utf8_path)
+        
+        uploads[file_id] = UploadRecord(file_path, utf8_path)
         
         return {
             "file_id": file_id,
             "filename": file.filename,
             "original_encoding": encoding,
-            "size": len(content)
+            "size": size
         }
     except Exception as e:
         logger.error(f"File upload failed: {str(e)}", exc_info=True)
@@ -189,14 +288,14 @@ async def process_text_to_speech(text: str, output_file: str, voice: str, rate:
     await communicate.save(output_file)
 
 @app.post("/tts")
-async def text_to_speech(request: TTSRequest, background_tasks: BackgroundTasks):
+async def text_to_speech(request: TTSRequest):
     """Convert text to speech"""
-    output_id = str(uuid.uuid4())
+    output_id = new_id()
     output_path = OUTPUT_DIR / f"{output_id}.mp3"
     
     try:
         logger.info(f"Processing TTS request for voice: {request.voice}")
-        # Process TTS in the background
+        # Process TTS
         await process_text_to_speech(
             request.text, 
             str(output_path), 
@@ -219,27 +318,27 @@ async def text_to_speech(request: TTSRequest, background_tasks: BackgroundTasks)
 @app.post("/batch-process")
 async def batch_process(request: BatchProcessRequest):
     """Batch process multiple files"""
-    output_files = []
+    sem = asyncio.Semaphore(TTS_CONCURRENCY)
     
-    try:
-        for file_id in request.file_ids:
-            # Find the UTF-8 converted file
-            utf8_files = list(UPLOAD_DIR.glob(f"{file_id}_utf8_*"))
-            
-            if not utf8_files:
-                raise HTTPException(status_code=404, detail=f"File {file_id} not found")
-            
-            utf8_file = utf8_files[0]
-            
-            # Read the file content
-            with open(utf8_file, 'r', encoding='utf-8') as f:
-                text = f.read()
-            
-            # Create output file
-            output_id = str(uuid.uuid4())
-            output_path = OUTPUT_DIR / f"{output_id}.mp3"
-            
-            # Process TTS
+    # Mint every output ID up front rather than once per task
+    output_ids = [new_id() for _ in request.file_ids]
+    
+    # Fail on a missing file before any TTS work starts
+    for file_id in request.file_ids:
+        if file_id not in uploads:
+            raise HTTPException(status_code=404, detail=f"File {file_id} not found")
+    
+    async def process_one(file_id: str, output_id: str) -> dict:
+        utf8_file = uploads[file_id].utf8_path
+        
+        # Read the file content in one worker-thread hop
+        text = await asyncio.to_thread(utf8_file.read_text, encoding='utf-8')
+        
+        # Create output file
+        output_path = OUTPUT_DIR / f"{output_id}.mp3"
+        
+        # Process TTS, bounded so a single batch cannot flood Edge TTS
+        async with sem:
             await process_text_to_speech(
                 text, 
                 str(output_path), 
@@ -248,15 +347,28 @@ async def batch_process(request: BatchProcessRequest):
                 request.volume, 
                 request.pitch
             )
-            
-            # Add to output files
-            original_name = utf8_file.name.replace(f"{file_id}_utf8_", "")
-            output_files.append({
-                "file_id": file_id,
-                "original_name": original_name,
-                "output_id": output_id,
-                "output_url": f"/outputs/{output_id}.mp3"
-            })
+        
+        original_name = utf8_file.name.replace(f"{file_id}_utf8_", "")
+        output_names[output_id] = original_name
+        return {
+            "file_id": file_id,
+            "original_name": original_name,
+            "output_id": output_id,
+            "output_url": f"/outputs/{output_id}.mp3"
+        }
+    
+    try:
+        # Let every job finish so one failure doesn't leave the others running unobserved
+        results = await asyncio.gather(*(
+            process_one(file_id, output_id)
+            for file_id, output_id in zip(request.file_ids, output_ids)
+        ), return_exceptions=True)
+        
+        output_files = []
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+            output_files.append(result)
         
         return {
             "success": True,
@@ -272,23 +384,31 @@ async def download_file(output_id: str):
     """Download processed audio file"""
     file_path = OUTPUT_DIR / f"{output_id}.mp3"
     
-    if not file_path.exists():
+    # Reuse this stat for the response instead of letting FileResponse stat again
+    try:
+        stat_result = file_path.stat()
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="File not found")
     
-    return FileResponse(path=file_path, filename=f"{output_id}.mp3", media_type="audio/mpeg")
+    # Name the download after the source file when it came from a batch
+    original_name = output_names.get(output_id)
+    filename = f"{Path(original_name).stem}.mp3" if original_name else f"{output_id}.mp3"
+    
+    return FileResponse(path=file_path, filename=filename, media_type="audio/mpeg", stat_result=stat_result)
 
 @app.delete("/file/{file_id}")
 async def delete_file(file_id: str):
     """Delete an uploaded file"""
-    # Find all files with this ID
-    files = list(UPLOAD_DIR.glob(f"{file_id}*"))
-    
-    if not files:
+    record = uploads.pop(file_id, None)
+    if not record:
         raise HTTPException(status_code=404, detail="File not found")
     
-    # Delete all files with this ID
-    for file in files:
-        file.unlink()
+    def remove_files():
+        # Delete the uploaded file and its UTF-8 copy, which may be the same file
+        for path in {record.raw_path, record.utf8_path}:
+            path.unlink(missing_ok=True)
+    
+    await asyncio.to_thread(remove_files)
     
     return {"success": True, "message": f"Files with ID {file_id} deleted"}
 
@@ -297,13 +417,24 @@ async def delete_output(output_id: str):
     """Delete a processed output file"""
     file_path = OUTPUT_DIR / f"{output_id}.mp3"
     
-    if not file_path.exists():
+    # Unlink directly; a missing file surfaces as FileNotFoundError
+    try:
+        await asyncio.to_thread(file_path.unlink)
+    except FileNotFoundError:
         raise HTTPException(status_code=404, detail="Output file not found")
-    
-    file_path.unlink()
+    output_names.pop(output_id, None)
     
     return {"success": True, "message": f"Output {output_id} deleted"}
 
 if __name__ == "__main__":
+    import sys
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True) 
\ No newline at end of file
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=8000,
+        reload=True,
+        # uvloop has no Windows build; let uvicorn pick the default loop there
+        loop="uvloop" if sys.platform != "win32" else "auto",
+        http="httptools"
+    )